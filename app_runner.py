@@ -1,34 +1,94 @@
-from fastapi import FastAPI, Depends, HTTPException, status
+from fastapi import FastAPI, Depends, HTTPException, Request, status
+from fastapi.encoders import jsonable_encoder
+from fastapi.params import Depends as DependsParam
+from fastapi.routing import APIRoute
+from starlette.routing import Match
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, make_transient_to_detached
 from sqlalchemy import select, or_
-from pydantic import BaseModel, EmailStr
-from typing import List, Optional
+from pydantic import BaseModel, EmailStr, TypeAdapter, ValidationError
+from typing import Any, List, Optional
+from urllib.parse import urlsplit, parse_qsl
+import inspect
+import logging
+import os
+from contextlib import asynccontextmanager
 from datetime import datetime, timedelta
 from decimal import Decimal
 from jose import jwt, JWTError
-from passlib.context import CryptContext
 
 from data_storage import (
-    get_db_connection, SystemIdentity, VendorEntity, BuyerProfile, CatalogItem, 
+    get_db_connection, get_read_connection, SystemIdentity, VendorEntity, BuyerProfile, CatalogItem, 
     BizConnection, CommerceFlow, FlowLine, SupportCase, CommMessage
 )
+from cache_bus import bus, principal_cache, catalog_cache
+from chat_archive import load_older
+from discovery import refresh_vendor_rank, feed_page
+import profiling
 
 # --- CONFIGURATION ---
 AUTH_SECRET = "SUPER_SECRET_KEY_CHANGE_ME"
 ALGO = "HS256"
 TOKEN_LIFE = 60
 
-security_ctx = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/token")
 
-app = FastAPI(title="SCP Core", version="2.1.0")
-
-app.add_middleware(
-    CORSMiddleware, allow_origins=["*"], allow_credentials=True,
-    allow_methods=["*"], allow_headers=["*"],
-)
+class DeferredRouter:
+    """Records endpoints at import time. FastAPI's signature/dependency analysis
+    (the bulk of startup cost) only runs when create_app() registers them."""
+
+    def __init__(self):
+        self.routes = []
+
+    def _route(self, method, path, **options):
+        def decorator(func):
+            self.routes.append((method, path, options, func))
+            return func
+        return decorator
+
+    def get(self, path, **options): return self._route("GET", path, **options)
+    def post(self, path, **options): return self._route("POST", path, **options)
+    def put(self, path, **options): return self._route("PUT", path, **options)
+
+    def register(self, application, wrap=None):
+        for method, path, options, func in self.routes:
+            application.add_api_route(path, wrap(func) if wrap else func, methods=[method], **options)
+
+router = DeferredRouter()
+_security_ctx = None
+_app = None
+
+@asynccontextmanager
+async def _lifespan(application):
+    yield
+    # Per-worker peak memory; gunicorn's worker_exit hook never runs under UvicornWorker
+    import resource
+    logging.getLogger("uvicorn.error").info(
+        "Worker %s exiting (peak rss %.1f MB)", os.getpid(), resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024)
+
+def create_app():
+    """Build the ASGI app. Schema setup is not done here: see manage.py init-db"""
+    application = FastAPI(title="SCP Core", version="2.1.0", lifespan=_lifespan)
+    application.add_middleware(
+        CORSMiddleware, allow_origins=["*"], allow_credentials=True,
+        allow_methods=["*"], allow_headers=["*"],
+    )
+    if profiling.PROFILE_MODE == "off":
+        router.register(application)
+    else:
+        router.register(application, wrap=profiling.profiled)
+        profiling.install(application)
+    return application
+
+def __getattr__(name):
+    # `app_runner:app` (uvicorn, gunicorn, tests) builds the app on first access
+    global _app
+    if name == "app":
+        if _app is None:
+            _app = create_app()
+        return _app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 # --- SCHEMAS ---
 
@@ -57,6 +117,13 @@ class SupplierRead(BaseModel):
     about: Optional[str] = None
     is_visible: bool
 
+class SupplierFeedItem(SupplierRead):
+    score: float
+
+class SupplierFeedPage(BaseModel):
+    items: List[SupplierFeedItem]
+    next_cursor: Optional[str] = None
+
 class SupplierUpdate(BaseModel):
     about: str
 
@@ -141,11 +208,38 @@ class MessageRead(BaseModel):
 class DiscountUpdate(BaseModel):
     percent: int
 
+class BatchOperation(BaseModel):
+    method: str = "GET"
+    path: str                      # may carry a query string, e.g. "/chat/5/older?limit=20"
+    body: Optional[Any] = None
+
+class BatchRequest(BaseModel):
+    operations: List[BatchOperation]
+
+class BatchResult(BaseModel):
+    status: int
+    body: Any = None
+
 # --- HELPERS ---
-def hash_pass(p): return security_ctx.hash(p)
-def check_pass(p, h): return security_ctx.verify(p, h)
+def get_security_ctx():
+    # passlib loads its bcrypt backend on construction; only pay that when a password is touched
+    global _security_ctx
+    if _security_ctx is None:
+        from passlib.context import CryptContext
+        _security_ctx = CryptContext(schemes=["bcrypt"], deprecated="auto")
+    return _security_ctx
+
+def hash_pass(p): return get_security_ctx().hash(p)
+def check_pass(p, h): return get_security_ctx().verify(p, h)
 
 def get_current_actor(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db_connection)):
+    return resolve_actor(token, db)
+
+def get_current_reader(token: str = Depends(oauth2_scheme), db: Session = Depends(get_read_connection)):
+    # Same as get_current_actor, but on the request's read-only session
+    return resolve_actor(token, db)
+
+def resolve_actor(token: str, db: Session):
     try:
         payload = jwt.decode(token, AUTH_SECRET, algorithms=[ALGO])
         email = payload.get("sub")
@@ -153,17 +247,62 @@ def get_current_actor(token: str = Depends(oauth2_scheme), db: Session = Depends
     except JWTError:
         raise HTTPException(401, detail="Invalid Token")
     
+    cached = principal_cache.get(email)
+    if cached:
+        # Re-attach the cached row without a round-trip
+        actor = SystemIdentity(**cached)
+        make_transient_to_detached(actor)
+        return db.merge(actor, load=False)
+
     actor = db.execute(select(SystemIdentity).where(SystemIdentity.email_addr == email)).scalars().first()
     if not actor: raise HTTPException(401)
+    principal_cache.put(email, {
+        "uid": actor.uid, "email_addr": actor.email_addr, "auth_hash": actor.auth_hash,
+        "full_name": actor.full_name, "access_role": actor.access_role
+    }, db)
     return actor
 
-@app.get("/")
+def vendor_of(db: Session, user: SystemIdentity):
+    # Looked up once per session, so the sub-requests of a /batch share it
+    key = ("vendor_of", user.uid)
+    if key not in db.info:
+        db.info[key] = db.execute(select(VendorEntity).where(VendorEntity.identity_id == user.uid)).scalars().first()
+    return db.info[key]
+
+def link_status(db: Session, consumer_uid: int, vendor_vid: int):
+    # Access check: always read from the database, never from a per-worker cache
+    link = db.execute(select(BizConnection).where(
+        BizConnection.consumer_ref_id == consumer_uid,
+        BizConnection.vendor_ref_id == vendor_vid
+    )).scalars().first()
+    return link.current_status if link else None
+
+def catalog_for(db: Session, vendor_vid: int):
+    result = catalog_cache.get(str(vendor_vid))
+    if result is not None:
+        return result
+
+    items = db.execute(select(CatalogItem).where(CatalogItem.vendor_id == vendor_vid)).scalars().all()
+    result = []
+    for i in items:
+        orig = float(i.cost_per_unit)
+        disc = i.discount_percent or 0
+        final = orig * (1 - disc / 100.0)
+        result.append({
+            "id": i.pid, "supplier_id": i.vendor_id, "name": i.title,
+            "price": final, "original_price": orig, "discountPercent": disc,
+            "quantity": i.stock_level, "unit": i.measurement_unit
+        })
+    catalog_cache.put(str(vendor_vid), result, db)
+    return result
+
+@router.get("/")
 def root():
     return {"status": "SCP Backend Online", "version": "2.1.0"}
 
 # --- ENDPOINTS ---
 
-@app.post("/auth/token", response_model=Token)
+@router.post("/auth/token", response_model=Token)
 def generate_token(form: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db_connection)):
     user = db.execute(select(SystemIdentity).where(SystemIdentity.email_addr == form.username)).scalars().first()
     if not user or not check_pass(form.password, user.auth_hash):
@@ -173,7 +312,7 @@ def generate_token(form: OAuth2PasswordRequestForm = Depends(), db: Session = De
     token = jwt.encode({"sub": user.email_addr, "exp": exp}, AUTH_SECRET, algorithm=ALGO)
     return {"access_token": token, "token_type": "bearer", "user_id": user.uid, "role": user.access_role}
 
-@app.post("/auth/register", response_model=UserRead)
+@router.post("/auth/register", response_model=UserRead)
 def register_user(user_data: UserCreate, db: Session = Depends(get_db_connection)):
     # Changed to accept JSON body (UserCreate model) instead of query params
     if db.execute(select(SystemIdentity).where(SystemIdentity.email_addr == user_data.email)).scalars().first():
@@ -186,11 +325,15 @@ def register_user(user_data: UserCreate, db: Session = Depends(get_db_connection
         access_role=user_data.role
     )
     db.add(new_id)
+    bus.publish(db, "principals", user_data.email)
     db.commit()
     db.refresh(new_id)
     
     if user_data.role == "supplier_admin":
-        db.add(VendorEntity(display_name=user_data.name, identity_id=new_id.uid, is_discoverable=False))
+        vendor = VendorEntity(display_name=user_data.name, identity_id=new_id.uid, is_discoverable=False)
+        db.add(vendor)
+        db.flush()
+        refresh_vendor_rank(db, vendor.vid)
         db.commit()
     elif user_data.role == "consumer":
         db.add(BuyerProfile(org_name=user_data.name, identity_id=new_id.uid))
@@ -200,18 +343,18 @@ def register_user(user_data: UserCreate, db: Session = Depends(get_db_connection
 
 # --- SUPPLIER PROFILE MANAGEMENT ---
 
-@app.put("/supplier/profile")
+@router.put("/supplier/profile")
 def update_profile(data: SupplierUpdate, user: SystemIdentity = Depends(get_current_actor), db: Session = Depends(get_db_connection)):
-    vendor = db.execute(select(VendorEntity).where(VendorEntity.identity_id == user.uid)).scalars().first()
+    vendor = vendor_of(db, user)
     if not vendor: raise HTTPException(403, detail="Not a supplier")
     
     vendor.about_text = data.about
     db.commit()
     return {"status": "updated", "about": vendor.about_text}
 
-@app.post("/supplier/visibility/{action}")
+@router.post("/supplier/visibility/{action}")
 def toggle_visibility(action: str, user: SystemIdentity = Depends(get_current_actor), db: Session = Depends(get_db_connection)):
-    vendor = db.execute(select(VendorEntity).where(VendorEntity.identity_id == user.uid)).scalars().first()
+    vendor = vendor_of(db, user)
     if not vendor: raise HTTPException(403)
     
     if action == "show":
@@ -221,13 +364,14 @@ def toggle_visibility(action: str, user: SystemIdentity = Depends(get_current_ac
     else:
         raise HTTPException(400, detail="Action must be 'show' or 'hide'")
         
+    refresh_vendor_rank(db, vendor.vid)
     db.commit()
     return {"status": "updated", "is_visible": vendor.is_discoverable}
 
 # --- DISCOVERY & LINKING ---
 
-@app.get("/suppliers", response_model=List[SupplierRead])
-def list_all_suppliers(db: Session = Depends(get_db_connection)):
+@router.get("/suppliers", response_model=List[SupplierRead])
+def list_all_suppliers(db: Session = Depends(get_read_connection)):
     vendors = db.execute(select(VendorEntity).where(VendorEntity.is_discoverable == True)).scalars().all()
     return [
         {
@@ -239,7 +383,16 @@ def list_all_suppliers(db: Session = Depends(get_db_connection)):
         } for v in vendors
     ]
 
-@app.post("/links", response_model=LinkRequestRead)
+@router.get("/suppliers/feed", response_model=SupplierFeedPage)
+def supplier_feed(limit: int = 20, cursor: Optional[str] = None, db: Session = Depends(get_read_connection)):
+    # Ranked, paginated discovery; pass next_cursor back as `cursor` for the following page
+    if limit < 1 or limit > 100: raise HTTPException(400, detail="limit must be between 1 and 100")
+    try:
+        return feed_page(db, limit, cursor)
+    except ValueError:
+        raise HTTPException(400, detail="Invalid cursor")
+
+@router.post("/links", response_model=LinkRequestRead)
 def request_link(req: LinkRequestCreate, user: SystemIdentity = Depends(get_current_actor), db: Session = Depends(get_db_connection)):
     if user.access_role != "consumer": raise HTTPException(403, detail="Consumers only")
     
@@ -260,8 +413,8 @@ def request_link(req: LinkRequestCreate, user: SystemIdentity = Depends(get_curr
     db.refresh(conn)
     return {"id": conn.cid, "consumer_id": conn.consumer_ref_id, "supplier_id": conn.vendor_ref_id, "status": conn.current_status, "created_at": conn.timestamp}
 
-@app.get("/links/my-requests", response_model=List[LinkRequestRead])
-def get_my_links(user: SystemIdentity = Depends(get_current_actor), db: Session = Depends(get_db_connection)):
+@router.get("/links/my-requests", response_model=List[LinkRequestRead])
+def get_my_links(user: SystemIdentity = Depends(get_current_reader), db: Session = Depends(get_read_connection)):
     results = db.execute(
         select(BizConnection, VendorEntity)
         .join(VendorEntity, BizConnection.vendor_ref_id == VendorEntity.vid)
@@ -279,9 +432,9 @@ def get_my_links(user: SystemIdentity = Depends(get_current_actor), db: Session
     } for l, v in results]
 
 
-@app.get("/supplier/links", response_model=List[LinkRequestRead])
-def get_incoming_links(user: SystemIdentity = Depends(get_current_actor), db: Session = Depends(get_db_connection)):
-    vendor = db.execute(select(VendorEntity).where(VendorEntity.identity_id == user.uid)).scalars().first()
+@router.get("/supplier/links", response_model=List[LinkRequestRead])
+def get_incoming_links(user: SystemIdentity = Depends(get_current_reader), db: Session = Depends(get_read_connection)):
+    vendor = vendor_of(db, user)
     if not vendor: return []
     
     # Join with SystemIdentity to get consumer name
@@ -303,94 +456,70 @@ def get_incoming_links(user: SystemIdentity = Depends(get_current_actor), db: Se
         })
     return links_data
 
-@app.put("/supplier/links/{link_id}", response_model=LinkRequestRead)
+@router.put("/supplier/links/{link_id}", response_model=LinkRequestRead)
 def respond_link(link_id: int, update: LinkRequestUpdate, user: SystemIdentity = Depends(get_current_actor), db: Session = Depends(get_db_connection)):
     conn = db.execute(select(BizConnection).where(BizConnection.cid == link_id)).scalars().first()
     if not conn: raise HTTPException(404)
     
-    vendor = db.execute(select(VendorEntity).where(VendorEntity.identity_id == user.uid)).scalars().first()
+    vendor = vendor_of(db, user)
     if not vendor or vendor.vid != conn.vendor_ref_id:
         raise HTTPException(403)
 
     conn.current_status = update.status
+    refresh_vendor_rank(db, conn.vendor_ref_id)
     db.commit()
     return {"id": conn.cid, "consumer_id": conn.consumer_ref_id, "supplier_id": conn.vendor_ref_id, "status": conn.current_status, "created_at": conn.timestamp}
 
 # --- PRODUCTS ---
 
-@app.get("/products/supplier/{supplier_id}", response_model=List[ProductRead])
-def public_catalog(supplier_id: int, user: SystemIdentity = Depends(get_current_actor), db: Session = Depends(get_db_connection)):
+@router.get("/products/supplier/{supplier_id}", response_model=List[ProductRead])
+def public_catalog(supplier_id: int, user: SystemIdentity = Depends(get_current_reader), db: Session = Depends(get_read_connection)):
     # 1. Find the link between Consumer (User) and Supplier (Vendor ID)
-    link = db.execute(select(BizConnection).where(
-        BizConnection.consumer_ref_id == user.uid,
-        BizConnection.vendor_ref_id == supplier_id
-    )).scalars().first()
+    link_state = link_status(db, user.uid, supplier_id)
 
     # 2. Strict Security Check + CASE INSENSITIVE FIX
     # We check .lower() so "Accepted" matches "accepted"
-    if not link or link.current_status.lower() != "accepted":
+    if not link_state or link_state.lower() != "accepted":
          raise HTTPException(status_code=403, detail="Access denied. You must connect with this supplier first.")
 
-    # 3. Fetch the products
-    items = db.execute(select(CatalogItem).where(CatalogItem.vendor_id == supplier_id)).scalars().all()
-    
-    # 4. Format the results (calculate discounts)
-    result = []
-    for i in items:
-        orig = float(i.cost_per_unit)
-        disc = i.discount_percent or 0
-        final = orig * (1 - disc / 100.0)
-        result.append({
-            "id": i.pid, "supplier_id": i.vendor_id, "name": i.title,
-            "price": final, "original_price": orig, "discountPercent": disc,
-            "quantity": i.stock_level, "unit": i.measurement_unit
-        })
-    return result
+    # 3. Fetch the products and calculate discounts
+    return catalog_for(db, supplier_id)
 
 
 
-@app.post("/products", response_model=ProductRead)
+@router.post("/products", response_model=ProductRead)
 def add_product(prod: ProductCreate, user: SystemIdentity = Depends(get_current_actor), db: Session = Depends(get_db_connection)):
-    vendor = db.execute(select(VendorEntity).where(VendorEntity.identity_id == user.uid)).scalars().first()
+    vendor = vendor_of(db, user)
     if not vendor: raise HTTPException(403)
     item = CatalogItem(vendor_id=vendor.vid, title=prod.name, cost_per_unit=prod.price, stock_level=prod.quantity, measurement_unit=prod.unit)
     db.add(item)
+    bus.publish(db, "catalogs", vendor.vid)
+    refresh_vendor_rank(db, vendor.vid)
     db.commit()
     db.refresh(item)
     return {"id": item.pid, "supplier_id": item.vendor_id, "name": item.title, "price": item.cost_per_unit, "quantity": item.stock_level, "unit": item.measurement_unit, "original_price": item.cost_per_unit, "discountPercent": 0}
 
-@app.get("/products/my-catalog", response_model=List[ProductRead])
-def my_catalog(user: SystemIdentity = Depends(get_current_actor), db: Session = Depends(get_db_connection)):
-    vendor = db.execute(select(VendorEntity).where(VendorEntity.identity_id == user.uid)).scalars().first()
+@router.get("/products/my-catalog", response_model=List[ProductRead])
+def my_catalog(user: SystemIdentity = Depends(get_current_reader), db: Session = Depends(get_read_connection)):
+    vendor = vendor_of(db, user)
     if not vendor: return []
-    
-    items = db.execute(select(CatalogItem).where(CatalogItem.vendor_id == vendor.vid)).scalars().all()
-    result = []
-    for i in items:
-        orig = float(i.cost_per_unit)
-        disc = i.discount_percent or 0
-        final = orig * (1 - disc / 100.0)
-        result.append({
-            "id": i.pid, "supplier_id": i.vendor_id, "name": i.title,
-            "price": final, "original_price": orig, "discountPercent": disc,
-            "quantity": i.stock_level, "unit": i.measurement_unit
-        })
-    return result
+    return catalog_for(db, vendor.vid)
 
-@app.put("/products/{pid}/discount")
+@router.put("/products/{pid}/discount")
 def apply_discount(pid: int, payload: DiscountUpdate, user: SystemIdentity = Depends(get_current_actor), db: Session = Depends(get_db_connection)):
-    vendor = db.execute(select(VendorEntity).where(VendorEntity.identity_id == user.uid)).scalars().first()
+    vendor = vendor_of(db, user)
     if not vendor: raise HTTPException(403)
     item = db.execute(select(CatalogItem).where(CatalogItem.pid == pid, CatalogItem.vendor_id == vendor.vid)).scalars().first()
     if not item: raise HTTPException(404)
     item.discount_percent = payload.percent
+    bus.publish(db, "catalogs", vendor.vid)
     db.commit()
     return {"status": "updated", "percent": payload.percent}
 
 # MISSING ENDPOINT: Update Product (Edit button)
-@app.put("/products/{pid}", response_model=ProductRead)
+@router.put("/products/{pid}", response_model=ProductRead)
 def update_product(pid: int, prod: ProductUpdate, user: SystemIdentity = Depends(get_current_actor), db: Session = Depends(get_db_connection)):
-    vendor = db.execute(select(VendorEntity).where(VendorEntity.identity_id == user.uid)).scalars().first()
+    vendor = vendor_of(db, user)
     if not vendor: raise HTTPException(403)
     
     item = db.execute(select(CatalogItem).where(CatalogItem.pid == pid, CatalogItem.vendor_id == vendor.vid)).scalars().first()
@@ -400,6 +529,7 @@ def update_product(pid: int, prod: ProductUpdate, user: SystemIdentity = Depends
     item.cost_per_unit = prod.price
     item.stock_level = prod.quantity
     item.measurement_unit = prod.unit
+    bus.publish(db, "catalogs", vendor.vid)
     
     db.commit()
     db.refresh(item)
@@ -415,29 +545,25 @@ def update_product(pid: int, prod: ProductUpdate, user: SystemIdentity = Depends
     }
 
 # MISSING ENDPOINT: Delete Product
-@app.post("/products/delete/{pid}")
+@router.post("/products/delete/{pid}")
 def delete_product(pid: int, user: SystemIdentity = Depends(get_current_actor), db: Session = Depends(get_db_connection)):
-    vendor = db.execute(select(VendorEntity).where(VendorEntity.identity_id == user.uid)).scalars().first()
+    vendor = vendor_of(db, user)
     if not vendor: raise HTTPException(403)
     
     item = db.execute(select(CatalogItem).where(CatalogItem.pid == pid, CatalogItem.vendor_id == vendor.vid)).scalars().first()
     if not item: raise HTTPException(404)
     
     db.delete(item)
+    bus.publish(db, "catalogs", vendor.vid)
+    refresh_vendor_rank(db, vendor.vid)
     db.commit()
     return {"status": "deleted", "id": pid}
 
 # --- ORDERING ---
 
-@app.post("/orders", response_model=OrderRead)
+@router.post("/orders", response_model=OrderRead)
 def place_order(order: OrderCreate, user: SystemIdentity = Depends(get_current_actor), db: Session = Depends(get_db_connection)):
-    existing_link = db.execute(select(BizConnection).where(
-        BizConnection.consumer_ref_id == user.uid,
-        BizConnection.vendor_ref_id == order.supplier_id,
-        BizConnection.current_status == "accepted"
-    )).scalars().first()
-
-    if not existing_link:
+    if link_status(db, user.uid, order.supplier_id) != "accepted":
         raise HTTPException(status_code=403, detail="Must have accepted connection to order.")
 
     total_cost = 0.0
@@ -451,6 +577,7 @@ def place_order(order: OrderCreate, user: SystemIdentity = Depends(get_current_a
 
     flow = CommerceFlow(buyer_uid=user.uid, vendor_vid=order.supplier_id, net_value=total_cost, flow_status="pending")
     db.add(flow)
+    refresh_vendor_rank(db, order.supplier_id)
     db.commit()
     db.refresh(flow)
     for item in order.items:
@@ -458,9 +585,9 @@ def place_order(order: OrderCreate, user: SystemIdentity = Depends(get_current_a
     db.commit()
     return {"id": flow.oid, "consumer_id": user.uid, "supplier_id": order.supplier_id, "total_amount": flow.net_value, "status": flow.flow_status, "created_at": flow.created_on}
 
-@app.get("/orders", response_model=List[OrderRead])
-def get_my_orders(user: SystemIdentity = Depends(get_current_actor), db: Session = Depends(get_db_connection)):
-    vendor = db.execute(select(VendorEntity).where(VendorEntity.identity_id == user.uid)).scalars().first()
+@router.get("/orders", response_model=List[OrderRead])
+def get_my_orders(user: SystemIdentity = Depends(get_current_reader), db: Session = Depends(get_read_connection)):
+    vendor = vendor_of(db, user)
     if vendor:
         # Supplier sees orders for them
         orders = db.execute(select(CommerceFlow).where(CommerceFlow.vendor_vid == vendor.vid)).scalars().all()
@@ -471,9 +598,9 @@ def get_my_orders(user: SystemIdentity = Depends(get_current_actor), db: Session
     return [{"id": o.oid, "consumer_id": o.buyer_uid, "supplier_id": o.vendor_vid, "total_amount": float(o.net_value), "status": o.flow_status, "created_at": o.created_on} for o in orders]
 
 # MISSING ENDPOINT: Update Order Status (Accept/Reject)
-@app.put("/orders/{oid}/status")
+@router.put("/orders/{oid}/status")
 def update_order_status(oid: int, status_update: OrderStatusUpdate, user: SystemIdentity = Depends(get_current_actor), db: Session = Depends(get_db_connection)):
-    vendor = db.execute(select(VendorEntity).where(VendorEntity.identity_id == user.uid)).scalars().first()
+    vendor = vendor_of(db, user)
     if not vendor: raise HTTPException(403, detail="Only suppliers can manage orders")
     
     order = db.execute(select(CommerceFlow).where(CommerceFlow.oid == oid, CommerceFlow.vendor_vid == vendor.vid)).scalars().first()
@@ -485,7 +612,7 @@ def update_order_status(oid: int, status_update: OrderStatusUpdate, user: System
 
 # --- CHAT & SUPPORT ---
 
-@app.post("/complaints", response_model=ComplaintRead)
+@router.post("/complaints", response_model=ComplaintRead)
 def submit_complaint(comp: ComplaintCreate, user: SystemIdentity = Depends(get_current_actor), db: Session = Depends(get_db_connection)):
     case = SupportCase(consumer_uid=user.uid, narrative=comp.details, linked_order_id=comp.order_id)
     db.add(case)
@@ -493,20 +620,104 @@ def submit_complaint(comp: ComplaintCreate, user: SystemIdentity = Depends(get_c
     db.refresh(case)
     return {"id": case.sc_id, "consumer_id": case.consumer_uid, "details": case.narrative, "status": case.case_status, "created_at": case.opened_at}
 
-@app.get("/complaints", response_model=List[ComplaintRead])
-def list_complaints(user: SystemIdentity = Depends(get_current_actor), db: Session = Depends(get_db_connection)):
+@router.get("/complaints", response_model=List[ComplaintRead])
+def list_complaints(user: SystemIdentity = Depends(get_current_reader), db: Session = Depends(get_read_connection)):
     cases = db.execute(select(SupportCase).where(SupportCase.consumer_uid == user.uid)).scalars().all()
     return [{"id": c.sc_id, "consumer_id": c.consumer_uid, "details": c.narrative, "status": c.case_status, "created_at": c.opened_at} for c in cases]
 
-@app.get("/chat/{other_user_id}", response_model=List[MessageRead])
-def get_chat_history(other_user_id: int, user: SystemIdentity = Depends(get_current_actor), db: Session = Depends(get_db_connection)):
+@router.get("/chat/{other_user_id}", response_model=List[MessageRead])
+def get_chat_history(other_user_id: int, user: SystemIdentity = Depends(get_current_reader), db: Session = Depends(get_read_connection)):
     msgs = db.execute(select(CommMessage).where(or_((CommMessage.sender_uid == user.uid) & (CommMessage.recipient_uid == other_user_id), (CommMessage.sender_uid == other_user_id) & (CommMessage.recipient_uid == user.uid))).order_by(CommMessage.sent_at)).scalars().all()
     return [{"id": m.mid, "sender_id": m.sender_uid, "recipient_id": m.recipient_uid, "content": m.text_body, "timestamp": m.sent_at} for m in msgs]
 
-@app.post("/chat", response_model=MessageRead)
+@router.get("/chat/{other_user_id}/older", response_model=List[MessageRead])
+def get_older_chat(other_user_id: int, before_id: Optional[int] = None, limit: int = 50, user: SystemIdentity = Depends(get_current_reader), db: Session = Depends(get_read_connection)):
+    # "Load older": pages back from before_id, reaching into the archive only when needed
+    if limit < 1 or limit > 200: raise HTTPException(400, detail="limit must be between 1 and 200")
+    return load_older(db, user.uid, other_user_id, before_id, limit)
+
+@router.post("/chat", response_model=MessageRead)
 def send_msg(msg: MessageCreate, user: SystemIdentity = Depends(get_current_actor), db: Session = Depends(get_db_connection)):
     m = CommMessage(sender_uid=user.uid, recipient_uid=msg.recipient_id, text_body=msg.content)
     db.add(m)
     db.commit()
     db.refresh(m)
     return {"id": m.mid, "sender_id": m.sender_uid, "recipient_id": m.recipient_uid, "content": m.text_body, "timestamp": m.sent_at}
+
+# --- BATCH ---
+
+BATCH_LIMIT = 20
+_batch_adapters = {}
+batch_log = logging.getLogger("scp.batch")
+
+def _run_operation(route: APIRoute, path_params: dict, query: dict, body, user: SystemIdentity, db: Session):
+    """Call an endpoint directly with the batch's principal and session instead of its own dependencies"""
+    kwargs = {}
+    for name, param in inspect.signature(route.endpoint).parameters.items():
+        if isinstance(param.default, DependsParam):
+            if param.default.dependency in (get_current_actor, get_current_reader):
+                kwargs[name] = user
+            elif param.default.dependency in (get_db_connection, get_read_connection):
+                kwargs[name] = db
+            else:
+                raise HTTPException(400, detail="Endpoint not available in batch")
+        elif inspect.isclass(param.annotation) and issubclass(param.annotation, BaseModel):
+            kwargs[name] = param.annotation.model_validate(body if body is not None else {})
+        elif name in path_params or name in query:
+            raw = path_params[name] if name in path_params else query[name]
+            kwargs[name] = TypeAdapter(param.annotation).validate_python(raw)
+        elif param.default is inspect.Parameter.empty:
+            raise HTTPException(422, detail=f"Missing parameter: {name}")
+
+    result = route.endpoint(**kwargs)
+    if route.response_model is not None:
+        adapter = _batch_adapters.get(route.unique_id)
+        if adapter is None:
+            adapter = _batch_adapters[route.unique_id] = TypeAdapter(route.response_model)
+        result = adapter.dump_python(adapter.validate_python(result), mode="json")
+    return jsonable_encoder(result)
+
+@router.post("/batch", response_model=List[BatchResult])
+def run_batch(batch: BatchRequest, request: Request, user: SystemIdentity = Depends(get_current_actor), db: Session = Depends(get_db_connection), read_db: Session = Depends(get_read_connection)):
+    """Run several API calls in one round-trip, authenticated once.
+
+    Operations run in request order, exactly as separate calls would. GETs
+    before the first write share one read-only snapshot; from the first write
+    on, everything runs on the write session so later reads see the batch's
+    own writes. A failing operation is rolled back and reported with its own
+    status; the remaining operations still run."""
+    if len(batch.operations) > BATCH_LIMIT:
+        raise HTTPException(400, detail=f"At most {BATCH_LIMIT} operations per batch")
+
+    results = []
+    session = read_db
+    for op in batch.operations:
+        if op.method.upper() != "GET":
+            session = db
+        url = urlsplit(op.path)
+        scope = {"type": "http", "path": url.path, "method": op.method.upper()}
+        route, path_params = None, {}
+        for candidate in request.app.routes:
+            if isinstance(candidate, APIRoute) and inspect.unwrap(candidate.endpoint) is not run_batch:
+                match, child = candidate.matches(scope)
+                if match == Match.FULL:
+                    route, path_params = candidate, child["path_params"]
+                    break
+
+        if route is None:
+            results.append({"status": 404, "body": {"detail": "Not Found"}})
+            continue
+        try:
+            body = _run_operation(route, path_params, dict(parse_qsl(url.query)), op.body, user, session)
+            results.append({"status": route.status_code or 200, "body": body})
+        except HTTPException as exc:
+            if session is db: session.rollback()  # the read snapshot stays open for later reads
+            results.append({"status": exc.status_code, "body": {"detail": exc.detail}})
+        except ValidationError as exc:
+            if session is db: session.rollback()
+            results.append({"status": 422, "body": {"detail": jsonable_encoder(exc.errors(include_url=False, include_context=False))}})
+        except Exception:
+            batch_log.exception("batch operation %s %s failed", op.method, op.path)
+            session.rollback()
+            results.append({"status": 500, "body": {"detail": "Internal Server Error"}})
+    return results
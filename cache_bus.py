@@ -0,0 +1,187 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from sqlalchemy import event, select, delete, func
+from sqlalchemy.orm import Session
+
+from data_storage import CacheEvent, open_session
+
+# --- CONFIGURATION ---
+POLL_INTERVAL = float(os.getenv("APP_CACHE_POLL_SECONDS", "0.5"))
+EVENT_RETENTION = int(os.getenv("APP_CACHE_EVENT_RETENTION_SECONDS", "3600"))
+CACHE_MAX_ENTRIES = int(os.getenv("APP_CACHE_MAX_ENTRIES", "10000"))
+# Upper bound on staleness even if an event is missed
+CACHE_TTL = float(os.getenv("APP_CACHE_TTL_SECONDS", "30"))
+# Event ids are handed out at insert but become visible at commit, which on
+# Postgres/MySQL need not happen in id order: re-read this many ids behind the newest seen
+RESCAN_WINDOW = int(os.getenv("APP_CACHE_RESCAN_WINDOW", "1000"))
+
+
+class WorkerCache:
+    """Small LRU dict living in one worker process. Entries are dropped when
+    any worker publishes an event for this cache's topic on the bus, or after ttl seconds."""
+
+    def __init__(self, topic, bus, max_entries=CACHE_MAX_ENTRIES, ttl=CACHE_TTL):
+        self.topic = topic
+        self.bus = bus
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        bus.subscribe(self)
+
+    def get(self, key):
+        self.bus.sync()
+        with self._lock:
+            if key not in self._entries:
+                return None
+            value, expires = self._entries[key]
+            if time.monotonic() >= expires:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def put(self, key, value, db: Session = None):
+        """Cache a value. Pass the session it was read from: if any invalidation
+        arrived after that session's transaction (snapshot) began, the value may
+        predate it and is not cached."""
+        if db is not None and db.info.get("bus_generation", -1) < self.bus.generation:
+            return
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key=None):
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class InvalidationBus:
+    """Database-backed change log shared by all workers.
+
+    Writers call publish() on their request session, so the event commits
+    together with the change it describes. Every worker polls the log at most
+    once per POLL_INTERVAL and drops the matching entries from its caches."""
+
+    def __init__(self, session_factory=open_session, poll_interval=POLL_INTERVAL, retention=EVENT_RETENTION, rescan_window=RESCAN_WINDOW):
+        self.session_factory = session_factory
+        self.poll_interval = poll_interval
+        self.retention = retention
+        self.rescan_window = rescan_window
+        self._caches = {}
+        self._last_seen = None
+        self._seen = set()  # eids already dispatched inside the rescan window
+        self.generation = 0  # bumped on every invalidation, compared against session start
+        self._next_poll = 0.0
+        self._next_prune = 0.0
+        self._lock = threading.Lock()
+
+    def subscribe(self, cache):
+        self._caches.setdefault(cache.topic, []).append(cache)
+
+    def publish(self, db: Session, topic, key=None):
+        db.add(CacheEvent(topic=topic, entry_key=None if key is None else str(key)))
+        # Our own caches are cleared right away; other workers catch up on their next poll
+        self._dispatch(topic, None if key is None else str(key))
+
+    def reset(self):
+        """Forget the log position and empty every cache (after fork, tests, schema resets)"""
+        with self._lock:
+            self._last_seen = None
+            self._seen.clear()
+            self._next_poll = 0.0
+            self._clear_all()
+
+    def sync(self, force=False):
+        now = time.monotonic()
+        if not force and now < self._next_poll:
+            return
+        if not self._lock.acquire(blocking=False):
+            return  # another thread of this worker is already polling
+        try:
+            self._next_poll = now + self.poll_interval
+            with self.session_factory() as db:
+                self._poll(db)
+                if now >= self._next_prune:
+                    self._next_prune = now + max(self.retention / 10, 1)
+                    self._prune(db)
+        finally:
+            self._lock.release()
+
+    def _poll(self, db: Session):
+        oldest, newest = db.execute(select(func.min(CacheEvent.eid), func.max(CacheEvent.eid))).one()
+        if newest is None:
+            newest = 0
+        if self._last_seen is None:
+            # Fresh worker: caches are empty, nothing to replay
+            self._last_seen = newest
+            self._seen = set(db.execute(
+                select(CacheEvent.eid).where(CacheEvent.eid > newest - self.rescan_window)
+            ).scalars())
+            return
+        if newest < self._last_seen or (oldest is not None and oldest > self._last_seen + 1):
+            # Log was truncated or pruned past our position: we may have missed events
+            self._clear_all()
+            self._last_seen = newest
+            self._seen.clear()
+            return
+
+        # Rescan a trailing window so an event that committed after a higher eid is still seen
+        low_water = self._last_seen - self.rescan_window
+        events = db.execute(
+            select(CacheEvent.eid, CacheEvent.topic, CacheEvent.entry_key)
+            .where(CacheEvent.eid > low_water)
+            .order_by(CacheEvent.eid)
+        ).all()
+        for eid, topic, key in events:
+            if eid in self._seen:
+                continue
+            self._dispatch(topic, key)
+            self._seen.add(eid)
+            self._last_seen = max(self._last_seen, eid)
+        low_water = self._last_seen - self.rescan_window
+        self._seen = {eid for eid in self._seen if eid > low_water}
+
+    def _prune(self, db: Session):
+        cutoff = datetime.utcnow() - timedelta(seconds=self.retention)
+        newest = db.execute(select(func.max(CacheEvent.eid))).scalar()
+        if newest is None:
+            return
+        # Keep the newest row so SQLite never hands out an eid a worker has already seen
+        db.execute(delete(CacheEvent).where(CacheEvent.emitted_at < cutoff, CacheEvent.eid < newest))
+        db.commit()
+
+    def _dispatch(self, topic, key):
+        self.generation += 1
+        for cache in self._caches.get(topic, []):
+            cache.invalidate(key)
+
+    def _clear_all(self):
+        self.generation += 1
+        for caches in self._caches.values():
+            for cache in caches:
+                cache.invalidate()
+
+
+bus = InvalidationBus()
+
+@event.listens_for(Session, "after_begin")
+def _remember_generation(session, transaction, connection):
+    # Runs before the transaction's first statement, i.e. before its snapshot is taken
+    session.info["bus_generation"] = bus.generation
+
+# Per-worker caches kept coherent by the bus
+principal_cache = WorkerCache("principals", bus)   # email -> full SystemIdentity row, auth_hash included
+catalog_cache = WorkerCache("catalogs", bus)       # vendor vid -> formatted product list
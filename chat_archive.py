@@ -0,0 +1,146 @@
+import json
+import os
+import zlib
+from datetime import datetime, timedelta
+
+from sqlalchemy import select, delete, func, or_
+from sqlalchemy.orm import Session
+
+from data_storage import CommMessage, ChatArchiveBlock
+
+# --- CONFIGURATION ---
+ARCHIVE_AFTER_DAYS = int(os.getenv("APP_CHAT_ARCHIVE_DAYS", "90"))
+ARCHIVE_BATCH_SIZE = int(os.getenv("APP_CHAT_ARCHIVE_BATCH", "1000"))
+ARCHIVE_BLOCK_SIZE = int(os.getenv("APP_CHAT_ARCHIVE_BLOCK", "500"))  # messages per compressed block
+
+
+def _pack(rows):
+    return zlib.compress(json.dumps(rows, separators=(",", ":")).encode("utf-8"))
+
+def _unpack(payload):
+    return json.loads(zlib.decompress(payload).decode("utf-8"))
+
+def _as_read(m):
+    return {"id": m.mid, "sender_id": m.sender_uid, "recipient_id": m.recipient_uid, "content": m.text_body, "timestamp": m.sent_at}
+
+def _write_block(db: Session, block, low: int, high: int, content):
+    if block is None:
+        block = ChatArchiveBlock(pair_low_uid=low, pair_high_uid=high, partition_month=content[0][4][:7])
+        db.add(block)
+    block.first_mid, block.last_mid = content[0][0], content[-1][0]
+    block.first_sent_at = datetime.fromisoformat(content[0][4])
+    block.last_sent_at = datetime.fromisoformat(content[-1][4])
+    block.msg_count = len(content)
+    block.payload = _pack(content)
+
+def _store(db: Session, low: int, high: int, rows):
+    """Append rows (mid order) to the pair's newest block, starting a new block
+    when it is full or the month changes. Blocks of a pair never overlap in mid,
+    which load_older relies on."""
+    block = db.execute(
+        select(ChatArchiveBlock).where(
+            ChatArchiveBlock.pair_low_uid == low,
+            ChatArchiveBlock.pair_high_uid == high
+        ).order_by(ChatArchiveBlock.last_mid.desc()).limit(1)
+    ).scalars().first()
+    if block is not None and block.last_mid >= rows[0][0]:
+        raise RuntimeError(f"archive of pair {low}/{high} already reaches mid {block.last_mid}, cannot add mid {rows[0][0]}")
+
+    content = []
+    if block is not None and block.msg_count < ARCHIVE_BLOCK_SIZE and block.partition_month == rows[0][4][:7]:
+        content = _unpack(block.payload)
+    else:
+        block = None
+    for row in rows:
+        if content and (len(content) >= ARCHIVE_BLOCK_SIZE or content[-1][4][:7] != row[4][:7]):
+            _write_block(db, block, low, high, content)
+            block, content = None, []
+        content.append(row)
+    _write_block(db, block, low, high, content)
+
+def _pair_filter(user_a: int, user_b: int):
+    return or_(
+        (CommMessage.sender_uid == user_a) & (CommMessage.recipient_uid == user_b),
+        (CommMessage.sender_uid == user_b) & (CommMessage.recipient_uid == user_a),
+    )
+
+
+def archive_messages(db: Session, older_than: timedelta = None, batch_size: int = ARCHIVE_BATCH_SIZE, now: datetime = None):
+    """Move messages older than the cutoff out of comm_messages into compressed
+    per-pair, per-month blocks of up to ARCHIVE_BLOCK_SIZE messages. Works in
+    batches so each transaction stays short; each batch tops up the pair's
+    newest block rather than starting a new one. Returns the number archived.
+
+    Only a prefix of comm_messages in mid order is archived (everything below
+    the first message still inside the cutoff), so later runs always append
+    higher mids even when sent_at and mid order disagree."""
+    if older_than is None:
+        older_than = timedelta(days=ARCHIVE_AFTER_DAYS)
+    cutoff = (now or datetime.utcnow()) - older_than
+    archived = 0
+    # Tables created before comm_messages used AUTOINCREMENT reuse rowids once the
+    # table is empty, so the newest message always stays hot
+    boundary = db.execute(select(func.max(CommMessage.mid))).scalar()
+    if boundary is None:
+        return 0
+    first_recent = db.execute(select(func.min(CommMessage.mid)).where(CommMessage.sent_at >= cutoff)).scalar()
+    if first_recent is not None:
+        boundary = min(boundary, first_recent)
+
+    while True:
+        msgs = db.execute(
+            select(CommMessage)
+            .where(CommMessage.sent_at < cutoff, CommMessage.mid < boundary)
+            .order_by(CommMessage.mid)
+            .limit(batch_size)
+        ).scalars().all()
+        if not msgs:
+            break
+
+        partitions = {}
+        for m in msgs:
+            key = (min(m.sender_uid, m.recipient_uid), max(m.sender_uid, m.recipient_uid))
+            partitions.setdefault(key, []).append(m)
+
+        for (low, high), rows in partitions.items():
+            _store(db, low, high, [[m.mid, m.sender_uid, m.recipient_uid, m.text_body, m.sent_at.isoformat()] for m in rows])
+            db.flush()  # autoflush is off; the next partition's lookup must see this block
+
+        db.execute(delete(CommMessage).where(CommMessage.mid.in_([m.mid for m in msgs])))
+        db.commit()
+        archived += len(msgs)
+
+    return archived
+
+
+def load_older(db: Session, user_a: int, user_b: int, before_id: int = None, limit: int = 50):
+    """Page backwards through a conversation: the hot table first, then the
+    archive, only as far as needed to fill `limit`. Returns oldest-first."""
+    query = select(CommMessage).where(_pair_filter(user_a, user_b))
+    if before_id is not None:
+        query = query.where(CommMessage.mid < before_id)
+    hot = db.execute(query.order_by(CommMessage.mid.desc()).limit(limit)).scalars().all()
+    page = [_as_read(m) for m in hot]
+
+    if len(page) < limit:
+        cursor = hot[-1].mid if hot else before_id
+        low, high = min(user_a, user_b), max(user_a, user_b)
+        blocks = select(ChatArchiveBlock).where(
+            ChatArchiveBlock.pair_low_uid == low,
+            ChatArchiveBlock.pair_high_uid == high
+        )
+        if cursor is not None:
+            blocks = blocks.where(ChatArchiveBlock.first_mid < cursor)
+        # Every block holds at least one message, so `limit` blocks always suffice
+        for block in db.execute(blocks.order_by(ChatArchiveBlock.last_mid.desc()).limit(limit - len(page))).scalars():
+            for mid, sender, recipient, text, sent in reversed(_unpack(block.payload)):
+                if cursor is not None and mid >= cursor:
+                    continue
+                page.append({"id": mid, "sender_id": sender, "recipient_id": recipient, "content": text, "timestamp": datetime.fromisoformat(sent)})
+                if len(page) == limit:
+                    break
+            if len(page) == limit:
+                break
+
+    page.reverse()
+    return page
@@ -1,25 +1,102 @@
 import os
 from datetime import datetime
 from decimal import Decimal
-from sqlalchemy import create_engine, Column, Integer, String, Boolean, DateTime, ForeignKey, Text, Numeric, select
+from sqlalchemy import create_engine, event, Column, Integer, String, Boolean, DateTime, ForeignKey, Text, Numeric, Float, LargeBinary, Index, select
 from sqlalchemy.orm import sessionmaker, declarative_base, relationship
 from sqlalchemy.types import Enum as SQLEnum
 
 # --- 1. SETUP ---
 DB_CONNECTION = os.getenv("APP_DATA_SOURCE", "sqlite:///./core_storage.db")
 connect_args = {"check_same_thread": False} if "sqlite" in DB_CONNECTION else {}
+# GET endpoints may be pointed at a replica / separate pool; defaults to the primary
+READ_CONNECTION = os.getenv("APP_READ_DATA_SOURCE", DB_CONNECTION)
+read_connect_args = {"check_same_thread": False} if "sqlite" in READ_CONNECTION else {}
 
-engine = create_engine(DB_CONNECTION, connect_args=connect_args)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
+SessionLocal = sessionmaker(autocommit=False, autoflush=False)  # bound in get_engine()
+# Read sessions never commit, so skip expire-on-commit bookkeeping
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False)  # bound in get_read_engine()
+_engine = None
+_read_engine = None
+
+def _sqlite_wal(dbapi_connection, connection_record):
+    # WAL lets readers keep a snapshot open without blocking writers
+    dbapi_connection.execute("PRAGMA journal_mode=WAL")
+
+def _sqlite_read_only(dbapi_connection, connection_record):
+    _sqlite_wal(dbapi_connection, connection_record)
+    dbapi_connection.execute("PRAGMA query_only=ON")
+    # Take over transaction control from pysqlite so the "begin" hook below is honoured
+    dbapi_connection.isolation_level = None
+
+def _sqlite_begin_deferred(conn):
+    # Deferred: no lock until the first read, then one snapshot for the whole request
+    conn.exec_driver_sql("BEGIN DEFERRED")
+
+def get_engine():
+    """Build the engine on first use, so importing this module stays free of I/O"""
+    global _engine
+    if _engine is None:
+        _engine = create_engine(DB_CONNECTION, connect_args=connect_args)
+        if "sqlite" in DB_CONNECTION:
+            event.listen(_engine, "connect", _sqlite_wal)
+        SessionLocal.configure(bind=_engine)
+    return _engine
+
+def get_read_engine():
+    global _read_engine
+    if _read_engine is None:
+        if "sqlite" in READ_CONNECTION:
+            _read_engine = create_engine(READ_CONNECTION, connect_args=read_connect_args)
+            event.listen(_read_engine, "connect", _sqlite_read_only)
+            event.listen(_read_engine, "begin", _sqlite_begin_deferred)
+        else:
+            _read_engine = create_engine(READ_CONNECTION, connect_args=read_connect_args, isolation_level="REPEATABLE READ")
+        ReadSessionLocal.configure(bind=_read_engine)
+    return _read_engine
+
+def dispose_engines(close=True):
+    # After fork, children must open their own pooled connections
+    for eng in (_engine, _read_engine):
+        if eng is not None:
+            eng.dispose(close=close)
+
+def __getattr__(name):
+    # Keeps `from data_storage import engine` working without an import-time engine
+    if name == "engine":
+        return get_engine()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def open_session():
+    get_engine()
+    return SessionLocal()
+
+def init_schema():
+    """Create missing tables. Run once per deployment (manage.py init-db / gunicorn master), not per import"""
+    bind = get_engine()
+    Base.metadata.create_all(bind=bind)
+    # create_all skips tables that already exist, so add indexes introduced since
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=bind, checkfirst=True)
 
 def get_db_connection():
-    conn = SessionLocal()
+    conn = open_session()
     try:
         yield conn
     finally:
         conn.close()
 
+def get_read_connection():
+    """Session for GET endpoints: one read-only snapshot, always rolled back"""
+    get_read_engine()
+    conn = ReadSessionLocal()
+    try:
+        yield conn
+    finally:
+        conn.rollback()
+        conn.close()
+
 # --- 2. DATABASE ENTITIES ---
 
 class SystemIdentity(Base):
@@ -63,7 +140,7 @@ class BuyerProfile(Base):
 class CatalogItem(Base):
     __tablename__ = "catalog_items"
     pid = Column(Integer, primary_key=True, index=True)
-    vendor_id = Column(Integer, ForeignKey("vendor_entities.vid"), nullable=False)
+    vendor_id = Column(Integer, ForeignKey("vendor_entities.vid"), nullable=False, index=True)
     title = Column(String, nullable=False)
     cost_per_unit = Column(Numeric(10, 2), nullable=False)
     stock_level = Column(Integer, nullable=False)
@@ -76,7 +153,7 @@ class BizConnection(Base):
     __tablename__ = "biz_connections"
     cid = Column(Integer, primary_key=True, index=True)
     consumer_ref_id = Column(Integer, ForeignKey("system_identities.uid"), nullable=False)
-    vendor_ref_id = Column(Integer, ForeignKey("vendor_entities.vid"), nullable=False)
+    vendor_ref_id = Column(Integer, ForeignKey("vendor_entities.vid"), nullable=False, index=True)
     current_status = Column(String, default="pending") # "pending", "accepted", "rejected"
     timestamp = Column(DateTime, default=datetime.utcnow)
 
@@ -93,6 +170,8 @@ class CommerceFlow(Base):
 
     lines = relationship("FlowLine", back_populates="flow_ref")
 
+    __table_args__ = (Index("ix_commerce_flows_vendor_created", "vendor_vid", "created_on"),)
+
 class FlowLine(Base):
     __tablename__ = "flow_lines"
     lid = Column(Integer, primary_key=True, index=True)
@@ -119,10 +198,51 @@ class CommMessage(Base):
     sender_uid = Column(Integer, ForeignKey("system_identities.uid"), nullable=False)
     recipient_uid = Column(Integer, ForeignKey("system_identities.uid"), nullable=False)
     text_body = Column(Text, nullable=False)
-    sent_at = Column(DateTime, default=datetime.utcnow)
+    sent_at = Column(DateTime, default=datetime.utcnow, index=True)
 
     sender_ref = relationship("SystemIdentity", foreign_keys=[sender_uid], back_populates="sent_msgs")
     recipient_ref = relationship("SystemIdentity", foreign_keys=[recipient_uid], back_populates="rcvd_msgs")
 
-# Create tables
-Base.metadata.create_all(bind=engine)
+    # AUTOINCREMENT: mids must never be reused once older ones move to comm_message_archive
+    __table_args__ = (
+        Index("ix_comm_messages_pair_sent", "sender_uid", "recipient_uid", "sent_at"),
+        {"sqlite_autoincrement": True},
+    )
+
+class ChatArchiveBlock(Base):
+    """Compressed run of old comm_messages for one conversation pair, partitioned by month"""
+    __tablename__ = "comm_message_archive"
+    block_id = Column(Integer, primary_key=True, index=True)
+    pair_low_uid = Column(Integer, nullable=False)     # min(sender, recipient)
+    pair_high_uid = Column(Integer, nullable=False)    # max(sender, recipient)
+    partition_month = Column(String, nullable=False, index=True)  # "YYYY-MM"
+    first_mid = Column(Integer, nullable=False)
+    last_mid = Column(Integer, nullable=False)
+    first_sent_at = Column(DateTime, nullable=False)
+    last_sent_at = Column(DateTime, nullable=False)
+    msg_count = Column(Integer, nullable=False)
+    payload = Column(LargeBinary, nullable=False)      # zlib-compressed JSON rows
+
+    __table_args__ = (Index("ix_comm_archive_pair_last_mid", "pair_low_uid", "pair_high_uid", "last_mid"),)
+
+class VendorRanking(Base):
+    """Precomputed discovery score per vendor, kept current by discovery.refresh_vendor_rank"""
+    __tablename__ = "vendor_rankings"
+    vendor_vid = Column(Integer, ForeignKey("vendor_entities.vid"), primary_key=True)
+    listed = Column(Boolean, default=False, nullable=False)   # mirrors VendorEntity.is_discoverable
+    score = Column(Float, default=0.0, nullable=False)
+    catalog_size = Column(Integer, default=0, nullable=False)
+    accepted_links = Column(Integer, default=0, nullable=False)
+    recent_orders = Column(Integer, default=0, nullable=False)
+    refreshed_at = Column(DateTime, default=datetime.utcnow)
+
+    # The feed walks this index in order instead of sorting vendors per request
+    __table_args__ = (Index("ix_vendor_rankings_feed", "listed", "score", "vendor_vid"),)
+
+class CacheEvent(Base):
+    """Change log read by every worker to drop stale per-worker cache entries"""
+    __tablename__ = "cache_events"
+    eid = Column(Integer, primary_key=True, index=True)
+    topic = Column(String, nullable=False)             # "principals", "catalogs"
+    entry_key = Column(String, nullable=True)          # None = whole topic
+    emitted_at = Column(DateTime, default=datetime.utcnow, index=True)
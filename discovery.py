@@ -0,0 +1,128 @@
+import math
+import os
+from datetime import datetime, timedelta
+
+from sqlalchemy import select, func, or_, and_
+from sqlalchemy.orm import Session
+
+from data_storage import VendorEntity, VendorRanking, CatalogItem, BizConnection, CommerceFlow
+
+# --- CONFIGURATION ---
+RECENT_ORDER_DAYS = int(os.getenv("APP_RANK_RECENT_ORDER_DAYS", "30"))
+REFRESH_BATCH_SIZE = int(os.getenv("APP_RANK_REFRESH_BATCH", "100"))  # vendors per transaction
+
+# Weights of the ranking inputs; counts are log-scaled so one huge catalog can't drown the rest
+WEIGHT_VERIFIED = 10.0
+WEIGHT_CATALOG = 2.0
+WEIGHT_LINKS = 3.0
+WEIGHT_ORDERS = 4.0
+
+
+def compute_score(is_verified, catalog_size, accepted_links, recent_orders):
+    return (
+        (WEIGHT_VERIFIED if is_verified else 0.0)
+        + WEIGHT_CATALOG * math.log1p(catalog_size)
+        + WEIGHT_LINKS * math.log1p(accepted_links)
+        + WEIGHT_ORDERS * math.log1p(recent_orders)
+    )
+
+
+def refresh_vendor_rank(db: Session, vendor_vid: int, now: datetime = None):
+    """Recompute one vendor's ranking row from indexed counts. Call it in the
+    same transaction as the change that moved an input; the caller commits."""
+    db.flush()  # sessions run with autoflush off; counts must see the pending change
+    vendor = db.get(VendorEntity, vendor_vid)
+    if vendor is None:
+        return None
+
+    since = (now or datetime.utcnow()) - timedelta(days=RECENT_ORDER_DAYS)
+    catalog_size = db.execute(select(func.count(CatalogItem.pid)).where(CatalogItem.vendor_id == vendor_vid)).scalar()
+    accepted_links = db.execute(select(func.count(BizConnection.cid)).where(
+        BizConnection.vendor_ref_id == vendor_vid,
+        func.lower(BizConnection.current_status) == "accepted"
+    )).scalar()
+    recent_orders = db.execute(select(func.count(CommerceFlow.oid)).where(
+        CommerceFlow.vendor_vid == vendor_vid,
+        CommerceFlow.created_on >= since
+    )).scalar()
+
+    rank = db.get(VendorRanking, vendor_vid)
+    if rank is None:
+        rank = VendorRanking(vendor_vid=vendor_vid)
+        db.add(rank)
+    rank.listed = bool(vendor.is_discoverable)
+    rank.catalog_size = catalog_size
+    rank.accepted_links = accepted_links
+    rank.recent_orders = recent_orders
+    rank.score = compute_score(vendor.is_verified, catalog_size, accepted_links, recent_orders)
+    rank.refreshed_at = datetime.utcnow()
+    return rank
+
+
+def backfill_rankings(db: Session, now: datetime = None):
+    """Create ranking rows for vendors that have none (e.g. they predate the
+    feed). Cheap when nothing is missing; run at deploy by init-db / gunicorn."""
+    vids = db.execute(
+        select(VendorEntity.vid)
+        .outerjoin(VendorRanking, VendorRanking.vendor_vid == VendorEntity.vid)
+        .where(VendorRanking.vendor_vid == None)
+    ).scalars().all()
+    _refresh_in_batches(db, vids, now)
+    return len(vids)
+
+
+def refresh_all_rankings(db: Session, now: datetime = None):
+    """Full rebuild: ages out the recent-order window and picks up changes no
+    endpoint reports (e.g. is_verified). Schedule it, e.g. hourly from cron:
+    `python manage.py refresh-rankings`."""
+    vids = db.execute(select(VendorEntity.vid)).scalars().all()
+    _refresh_in_batches(db, vids, now)
+    return len(vids)
+
+
+def _refresh_in_batches(db: Session, vids, now: datetime = None):
+    # Commit every REFRESH_BATCH_SIZE vendors so the write lock is never held for the whole run
+    for start in range(0, len(vids), REFRESH_BATCH_SIZE):
+        for vid in vids[start:start + REFRESH_BATCH_SIZE]:
+            refresh_vendor_rank(db, vid, now)
+        db.commit()
+
+
+def encode_cursor(score, vid):
+    return f"{score!r}:{vid}"
+
+def decode_cursor(cursor):
+    score, vid = cursor.rsplit(":", 1)
+    return float(score), int(vid)
+
+
+def feed_page(db: Session, limit: int = 20, cursor: str = None):
+    """Top-K discoverable vendors by score, paged with a keyset cursor over the feed index"""
+    query = (
+        select(VendorRanking, VendorEntity)
+        .join(VendorEntity, VendorRanking.vendor_vid == VendorEntity.vid)
+        .where(VendorRanking.listed == True)
+    )
+    if cursor:
+        score, vid = decode_cursor(cursor)
+        query = query.where(or_(
+            VendorRanking.score < score,
+            and_(VendorRanking.score == score, VendorRanking.vendor_vid < vid)
+        ))
+    rows = db.execute(
+        query.order_by(VendorRanking.score.desc(), VendorRanking.vendor_vid.desc()).limit(limit + 1)
+    ).all()
+
+    items = [{
+        "id": v.vid,
+        "name": v.display_name,
+        "verification_status": v.is_verified,
+        "about": v.about_text,
+        "is_visible": v.is_discoverable,
+        "score": r.score
+    } for r, v in rows[:limit]]
+    next_cursor = None
+    if len(rows) > limit:
+        last = rows[limit - 1][0]
+        next_cursor = encode_cursor(last.score, last.vendor_vid)
+    return {"items": items, "next_cursor": next_cursor}
@@ -0,0 +1,67 @@
+"""Production launch settings.
+
+    gunicorn -c gunicorn_conf.py app_runner:app
+
+Development keeps using `uvicorn app_runner:app --reload`.
+"""
+import logging
+import multiprocessing
+import os
+import resource
+import time
+
+_boot_started = time.perf_counter()
+log = logging.getLogger("gunicorn.error")
+
+# --- WORKERS ---
+bind = os.getenv("APP_BIND", "0.0.0.0:8000")
+workers = int(os.getenv("APP_WORKERS", multiprocessing.cpu_count() * 2 + 1))
+worker_class = "uvicorn_worker.UvicornWorker"
+
+# Import the app once in the master; workers fork with it already loaded
+preload_app = True
+
+# --- SHUTDOWN / RECYCLING ---
+graceful_timeout = int(os.getenv("APP_GRACEFUL_TIMEOUT", "30"))
+timeout = int(os.getenv("APP_WORKER_TIMEOUT", "60"))
+keepalive = 5
+max_requests = int(os.getenv("APP_MAX_REQUESTS", "0"))
+max_requests_jitter = max_requests // 10
+
+accesslog = "-"
+errorlog = "-"
+
+
+def _rss_mb():
+    # ru_maxrss is reported in KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def on_starting(server):
+    # Schema is created once by the master before any worker forks
+    from data_storage import init_schema, open_session
+    from discovery import backfill_rankings
+    init_schema()
+    with open_session() as db:
+        added = backfill_rankings(db)
+    if added:
+        log.info("Backfilled discovery ranking for %d suppliers", added)
+
+
+def when_ready(server):
+    log.info("Master ready in %.1f ms (app preloaded, rss %.1f MB)",
+             (time.perf_counter() - _boot_started) * 1000, _rss_mb())
+
+
+def post_fork(server, worker):
+    # Pooled connections opened by the master must not be shared with children
+    from data_storage import dispose_engines
+    from cache_bus import bus
+    dispose_engines(close=False)
+    bus.reset()
+    worker._forked_at = time.perf_counter()
+
+
+def post_worker_init(worker):
+    log.info("Worker %s ready in %.1f ms (rss %.1f MB)",
+             worker.pid, (time.perf_counter() - worker._forked_at) * 1000, _rss_mb())
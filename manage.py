@@ -0,0 +1,55 @@
+"""Operational commands, run once per deployment rather than on every import.
+
+    python manage.py init-db
+    python manage.py archive-messages --older-than-days 90
+    python manage.py refresh-rankings     # schedule hourly (cron / k8s CronJob)
+"""
+import argparse
+import sys
+from datetime import timedelta
+
+from data_storage import init_schema, open_session, DB_CONNECTION
+from chat_archive import archive_messages, ARCHIVE_AFTER_DAYS, ARCHIVE_BATCH_SIZE
+from discovery import refresh_all_rankings, backfill_rankings
+
+
+def cmd_init_db(args):
+    init_schema()
+    with open_session() as db:
+        added = backfill_rankings(db)
+    print(f"Schema ready on {DB_CONNECTION} ({added} supplier rankings backfilled)")
+
+
+def cmd_archive_messages(args):
+    with open_session() as db:
+        moved = archive_messages(db, timedelta(days=args.older_than_days), args.batch_size)
+    print(f"Archived {moved} messages older than {args.older_than_days} days")
+
+
+
+def cmd_refresh_rankings(args):
+    with open_session() as db:
+        count = refresh_all_rankings(db)
+    print(f"Refreshed discovery ranking for {count} suppliers")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="SCP backend management")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    commands.add_parser("init-db", help="Create missing tables").set_defaults(func=cmd_init_db)
+
+    archive = commands.add_parser("archive-messages", help="Move old chat messages into the compressed archive")
+    archive.add_argument("--older-than-days", type=int, default=ARCHIVE_AFTER_DAYS)
+    archive.add_argument("--batch-size", type=int, default=ARCHIVE_BATCH_SIZE)
+    archive.set_defaults(func=cmd_archive_messages)
+
+    commands.add_parser("refresh-rankings", help="Rebuild every supplier's discovery score").set_defaults(func=cmd_refresh_rankings)
+
+    args = parser.parse_args(argv)
+    args.func(args)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
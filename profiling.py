@@ -0,0 +1,177 @@
+"""Debug profiling: SQL statements with timings and query plans, plus a cProfile
+summary of the endpoint, collected per request.
+
+APP_PROFILE_MODE:
+    off     (default) nothing is installed, no overhead
+    header  requests sending `X-Debug-Profile: <APP_PROFILE_SECRET>` get {"response": ..., "profile": ...}
+    always  every request is profiled and the report is logged; the header still embeds it
+
+The embedded report exposes SQL and code paths, so the header is ignored while
+APP_PROFILE_SECRET is unset.
+"""
+import functools
+import hmac
+import json
+import logging
+import os
+import time
+from contextvars import ContextVar
+
+from fastapi import Request
+from fastapi.responses import JSONResponse
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# --- CONFIGURATION ---
+PROFILE_MODE = os.getenv("APP_PROFILE_MODE", "off")
+PROFILE_HEADER = "X-Debug-Profile"
+PROFILE_SECRET = os.getenv("APP_PROFILE_SECRET", "")
+EXPLAINABLE = ("SELECT", "INSERT", "UPDATE", "DELETE", "WITH")
+TOP_FUNCTIONS = int(os.getenv("APP_PROFILE_TOP_FUNCTIONS", "15"))
+
+log = logging.getLogger("scp.profile")
+current_profile: ContextVar = ContextVar("current_profile", default=None)
+
+
+class RequestProfile:
+    def __init__(self, method, path):
+        self.method = method
+        self.path = path
+        self.started = time.perf_counter()
+        self.statements = []
+        self.handler_ms = None
+        self.functions = []
+        self._in_handler = False
+
+    def run_handler(self, func, *args, **kwargs):
+        if self._in_handler:
+            # Endpoints called from /batch run inside the outer handler's profiler
+            return func(*args, **kwargs)
+        import cProfile  # only paid once profiling is actually used
+        self._in_handler = True
+        profiler = cProfile.Profile()
+        started = time.perf_counter()
+        try:
+            return profiler.runcall(func, *args, **kwargs)
+        finally:
+            self.handler_ms = (time.perf_counter() - started) * 1000
+            self._in_handler = False
+            self.functions = _summarise(profiler)
+
+    def report(self):
+        sql_ms = sum(s["duration_ms"] for s in self.statements)
+        return {
+            "method": self.method,
+            "path": self.path,
+            "total_ms": round((time.perf_counter() - self.started) * 1000, 3),
+            "sql": {"count": len(self.statements), "total_ms": round(sql_ms, 3), "statements": self.statements},
+            "python": {"handler_ms": None if self.handler_ms is None else round(self.handler_ms, 3), "top": self.functions},
+        }
+
+
+def _summarise(profiler):
+    import pstats
+    stats = pstats.Stats(profiler).stats
+    rows = sorted(stats.items(), key=lambda kv: kv[1][3], reverse=True)[:TOP_FUNCTIONS]
+    return [{
+        "function": f"{os.path.basename(filename)}:{line}({name})",
+        "calls": calls,
+        "own_ms": round(own * 1000, 3),
+        "cumulative_ms": round(cumulative * 1000, 3),
+    } for (filename, line, name), (_, calls, own, cumulative, _) in rows]
+
+
+def _explain(conn, cursor, statement, parameters, executemany):
+    # BEGIN, PRAGMA, SAVEPOINT and friends have no plan
+    if executemany or not statement.lstrip().upper().startswith(EXPLAINABLE):
+        return None
+    sqlite = conn.dialect.name == "sqlite"
+    prefix = "EXPLAIN QUERY PLAN " if sqlite else "EXPLAIN "
+    # Raw DBAPI cursor: goes around SQLAlchemy so these events don't fire again
+    plan_cursor = cursor.connection.cursor()
+    try:
+        if not sqlite:
+            # A failed statement aborts a Postgres transaction; keep the request's intact
+            plan_cursor.execute("SAVEPOINT profile_explain")
+        try:
+            plan_cursor.execute(prefix + statement, parameters)
+            plan = [" ".join(str(col) for col in row) for row in plan_cursor.fetchall()]
+        except Exception as exc:  # a plan is best-effort, never fail the request over it
+            if not sqlite:
+                plan_cursor.execute("ROLLBACK TO SAVEPOINT profile_explain")
+            return [f"unavailable: {exc}"]
+        if not sqlite:
+            plan_cursor.execute("RELEASE SAVEPOINT profile_explain")
+        return plan
+    finally:
+        plan_cursor.close()
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if current_profile.get() is not None:
+        conn.info.setdefault("profile_query_start", []).append(time.perf_counter())
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    profile = current_profile.get()
+    if profile is None or not conn.info.get("profile_query_start"):
+        return
+    elapsed = (time.perf_counter() - conn.info["profile_query_start"].pop()) * 1000
+    # Parameter values are left out on purpose: they include password hashes and message bodies
+    profile.statements.append({
+        "sql": statement,
+        "duration_ms": round(elapsed, 3),
+        "plan": _explain(conn, cursor, statement, parameters, executemany),
+    })
+
+
+def _wants_embed(request):
+    if not PROFILE_SECRET:
+        return False
+    return hmac.compare_digest(request.headers.get(PROFILE_HEADER, "").encode(), PROFILE_SECRET.encode())
+
+
+def profiled(func):
+    """Wrap an endpoint so its Python time is cProfiled when the request is being profiled"""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        profile = current_profile.get()
+        if profile is None:
+            return func(*args, **kwargs)
+        return profile.run_handler(func, *args, **kwargs)
+    return wrapper
+
+
+def install(application):
+    """Attach the SQL hooks and the request middleware. Only called when profiling is on."""
+    if not event.contains(Engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+
+    @application.middleware("http")
+    async def profile_request(request: Request, call_next):
+        embed = _wants_embed(request)
+        if not embed and PROFILE_MODE != "always":
+            return await call_next(request)
+
+        profile = RequestProfile(request.method, request.url.path)
+        token = current_profile.set(profile)
+        try:
+            response = await call_next(request)
+        finally:
+            current_profile.reset(token)
+
+        if not embed:
+            log.info("profile %s", json.dumps(profile.report()))
+            return response
+
+        body = b"".join([chunk async for chunk in response.body_iterator])
+        try:
+            original = json.loads(body) if body else None
+        except ValueError:
+            original = body.decode("utf-8", "replace")
+        wrapped = JSONResponse(status_code=response.status_code, content={"response": original, "profile": profile.report()})
+        # Keep CORS and any other headers set downstream; length and type describe the new body
+        for name, value in response.headers.raw:
+            if name.lower() not in (b"content-length", b"content-type"):
+                wrapped.raw_headers.append((name, value))
+        return wrapped
@@ -169,3 +169,450 @@ def test_12_get_nonexistent_supplier_products():
     data = response.json()
     # Should return an empty list, not crash
     assert data == []
+
+
+# --- MULTI-WORKER CACHE INVALIDATION ---
+
+from sqlalchemy import select
+from data_storage import CacheEvent
+from cache_bus import InvalidationBus, WorkerCache, catalog_cache
+
+def _register_and_login(email, role, name="Tester"):
+    client.post("/auth/register", json={"email": email, "password": "pass", "name": name, "role": role})
+    response = client.post("/auth/token", data={"username": email, "password": "pass"})
+    assert response.status_code == 200
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+def test_13_bus_invalidates_other_worker_cache():
+    # Two buses on the same database stand in for two worker processes
+    worker_a = InvalidationBus(poll_interval=0)
+    worker_b = InvalidationBus(poll_interval=0)
+    cache_a = WorkerCache("catalogs", worker_a)
+    cache_b = WorkerCache("catalogs", worker_b)
+    worker_a.sync(force=True)
+    worker_b.sync(force=True)
+
+    cache_a.put("42", ["stale"])
+    cache_b.put("42", ["stale"])
+    cache_b.put("43", ["kept"])
+
+    db = SessionLocal()
+    worker_a.publish(db, "catalogs", 42)
+    db.commit()
+    db.close()
+
+    assert cache_a.get("42") is None  # publisher clears its own cache right away
+    assert cache_b.get("42") is None  # the other worker picks it up on its next poll
+    assert cache_b.get("43") == ["kept"]
+
+def test_13b_bus_sees_events_that_commit_out_of_order():
+    worker = InvalidationBus(poll_interval=0)
+    cache = WorkerCache("catalogs", worker)
+    worker.sync(force=True)
+
+    db = SessionLocal()
+    worker_b = InvalidationBus(poll_interval=0)
+    worker_b.publish(db, "catalogs", 1)
+    db.commit()
+    late_eid = db.execute(select(CacheEvent.eid).order_by(CacheEvent.eid.desc())).scalars().first()
+    # Reserve late_eid + 1 for a slow transaction, and let a later one commit first
+    db.add(CacheEvent(eid=late_eid + 2, topic="catalogs", entry_key="other"))
+    db.commit()
+    worker.sync(force=True)
+
+    cache.put("77", ["stale"])
+    db.add(CacheEvent(eid=late_eid + 1, topic="catalogs", entry_key="77"))
+    db.commit()
+    db.close()
+    worker.sync(force=True)
+    assert cache.get("77") is None
+
+def test_13c_cache_entries_expire():
+    worker = InvalidationBus(poll_interval=60)
+    cache = WorkerCache("catalogs", worker, ttl=0)
+    cache.put("1", ["value"])
+    assert cache.get("1") is None
+
+def test_14_catalog_cache_follows_product_edits():
+    headers = _register_and_login("cache-supplier@corp.com", "supplier_admin")
+    created = client.post("/products", json={"name": "Gadget", "price": 4.0, "quantity": 3, "unit": "pc"}, headers=headers)
+    assert created.status_code == 200
+    pid = created.json()["id"]
+
+    assert [p["name"] for p in client.get("/products/my-catalog", headers=headers).json()] == ["Gadget"]
+    assert catalog_cache.get(str(created.json()["supplier_id"])) is not None
+
+    client.put(f"/products/{pid}/discount", json={"percent": 50}, headers=headers)
+    catalog = client.get("/products/my-catalog", headers=headers).json()
+    assert catalog[0]["price"] == 2.0
+
+
+# --- COLD START ---
+
+import os
+import subprocess
+import sys
+
+# Measured at ~60 ms (mostly ORM model and schema class creation); fail well before a 2x regression
+IMPORT_BUDGET_MS = 90
+
+def test_15_import_is_lazy_and_fast(tmp_path):
+    # Third-party libraries are imported first so only this repo's own import work is timed
+    probe = (
+        "import time, fastapi, fastapi.security, fastapi.middleware.cors, sqlalchemy.orm, jose.jwt, pydantic\n"
+        "t = time.perf_counter()\n"
+        "import app_runner, data_storage\n"
+        "elapsed = (time.perf_counter() - t) * 1000\n"
+        "assert data_storage._engine is None, 'engine built at import'\n"
+        "assert app_runner._app is None, 'app built at import'\n"
+        "assert app_runner._security_ctx is None, 'crypt context built at import'\n"
+        "import sys\n"
+        "for lazy in ('passlib', 'cProfile', 'pstats'):\n"
+        "    assert lazy not in sys.modules, lazy + ' imported at import time'\n"
+        "print(elapsed)\n"
+    )
+    env = dict(os.environ, APP_DATA_SOURCE=f"sqlite:///{tmp_path / 'cold.db'}")
+    result = subprocess.run(
+        [sys.executable, "-c", probe], cwd=os.path.dirname(os.path.abspath(__file__)),
+        env=env, capture_output=True, text=True
+    )
+    assert result.returncode == 0, result.stderr
+    assert not (tmp_path / "cold.db").exists()  # no DDL round-trips at import
+    assert float(result.stdout.strip()) < IMPORT_BUDGET_MS
+
+def test_16_manage_init_db(tmp_path):
+    env = dict(os.environ, APP_DATA_SOURCE=f"sqlite:///{tmp_path / 'managed.db'}")
+    result = subprocess.run(
+        [sys.executable, "manage.py", "init-db"], cwd=os.path.dirname(os.path.abspath(__file__)),
+        env=env, capture_output=True, text=True
+    )
+    assert result.returncode == 0, result.stderr
+    assert (tmp_path / "managed.db").exists()
+
+
+# --- CHAT ARCHIVE ---
+
+from datetime import datetime, timedelta
+from sqlalchemy import func
+from data_storage import CommMessage, ChatArchiveBlock
+import chat_archive
+from chat_archive import archive_messages
+
+def _user_id(email):
+    return client.post("/auth/token", data={"username": email, "password": "pass"}).json()["user_id"]
+
+def _page_contents(user_a, user_b):
+    db = SessionLocal()
+    page = chat_archive.load_older(db, user_a, user_b, limit=50)
+    db.close()
+    return [m["content"] for m in page]
+
+def test_17_archive_and_load_older():
+    alice = _register_and_login("alice@chat.com", "consumer", "Alice")
+    bob = _register_and_login("bob@chat.com", "consumer", "Bob")
+    alice_uid, bob_uid = _user_id("alice@chat.com"), _user_id("bob@chat.com")
+
+    db = SessionLocal()
+    old = datetime.utcnow() - timedelta(days=200)
+    for n in range(5):
+        db.add(CommMessage(sender_uid=alice_uid if n % 2 == 0 else bob_uid,
+                           recipient_uid=bob_uid if n % 2 == 0 else alice_uid,
+                           text_body=f"old {n}", sent_at=old + timedelta(minutes=n)))
+    db.commit()
+    db.close()
+    client.post("/chat", json={"recipient_id": bob_uid, "content": "fresh"}, headers=alice)
+
+    db = SessionLocal()
+    assert archive_messages(db, timedelta(days=90), batch_size=2) == 5
+    assert db.query(CommMessage).filter(CommMessage.text_body.like("old%")).count() == 0
+    assert db.query(ChatArchiveBlock).count() >= 1
+    db.close()
+
+    # Hot history only holds the recent message
+    assert [m["content"] for m in client.get(f"/chat/{bob_uid}", headers=alice).json()] == ["fresh"]
+
+    # "Load older" pages transparently from the hot table into the archive
+    page = client.get(f"/chat/{bob_uid}/older", params={"limit": 3}, headers=alice).json()
+    assert [m["content"] for m in page] == ["old 3", "old 4", "fresh"]
+    page = client.get(f"/chat/{alice_uid}/older", params={"limit": 3, "before_id": page[0]["id"]}, headers=bob).json()
+    assert [m["content"] for m in page] == ["old 0", "old 1", "old 2"]
+
+def test_17b_archived_mids_are_never_reused():
+    db = SessionLocal()
+    db.execute(CommMessage.__table__.delete())
+    db.add(CommMessage(sender_uid=1, recipient_uid=2, text_body="ancient", sent_at=datetime.utcnow() - timedelta(days=400)))
+    db.commit()
+    archived_max = db.execute(select(func.max(ChatArchiveBlock.last_mid))).scalar() or 0
+    archive_messages(db, timedelta(days=90))
+    db.add(CommMessage(sender_uid=1, recipient_uid=2, text_body="new"))
+    db.commit()
+    newest = db.execute(select(func.max(CommMessage.mid))).scalar()
+    db.close()
+    assert newest > archived_max
+
+def test_17c_archive_batches_fill_one_block_per_pair_and_month(monkeypatch):
+    monkeypatch.setattr(chat_archive, "ARCHIVE_BLOCK_SIZE", 4)
+    db = SessionLocal()
+    db.execute(CommMessage.__table__.delete())
+    start = datetime(2020, 3, 1, 12, 0)
+    for n in range(10):
+        # Two conversations interleaved, as they are in a real sent_at-ordered batch
+        pair = (901, 902) if n % 2 == 0 else (903, 904)
+        db.add(CommMessage(sender_uid=pair[0], recipient_uid=pair[1], text_body=f"m{n}", sent_at=start + timedelta(minutes=n)))
+    db.add(CommMessage(sender_uid=1, recipient_uid=2, text_body="keeps the newest mid hot"))
+    db.commit()
+
+    assert archive_messages(db, timedelta(days=90), batch_size=3) == 10
+    blocks = db.execute(
+        select(ChatArchiveBlock).where(ChatArchiveBlock.pair_low_uid == 901).order_by(ChatArchiveBlock.first_mid)
+    ).scalars().all()
+    db.close()
+    assert [b.msg_count for b in blocks] == [4, 1]
+    assert _page_contents(901, 902) == ["m0", "m2", "m4", "m6", "m8"]
+
+def test_17d_archive_follows_mid_order_when_sent_at_disagrees():
+    db = SessionLocal()
+    db.execute(CommMessage.__table__.delete())
+    start = datetime(2020, 5, 1, 12, 0)
+    # Concurrent workers stamp sent_at before the row gets its mid at flush
+    for n, offset in enumerate([0, 1, 3, 2, 4, 5]):
+        db.add(CommMessage(sender_uid=905, recipient_uid=906, text_body=f"m{n + 1}", sent_at=start + timedelta(seconds=offset)))
+    db.commit()
+
+    assert archive_messages(db, timedelta(days=90), batch_size=3) == 5
+    seen, before_id = [], None
+    while True:
+        page = chat_archive.load_older(db, 905, 906, before_id=before_id, limit=2)
+        if not page:
+            break
+        seen = [m["content"] for m in page] + seen
+        before_id = page[0]["id"]
+    assert seen == ["m1", "m2", "m3", "m4", "m5", "m6"]
+
+    # A block overlapping the pair's archived mids would break that paging
+    with pytest.raises(RuntimeError):
+        chat_archive._store(db, 905, 906, [[1, 905, 906, "dup", start.isoformat()]])
+    db.rollback()
+    db.close()
+
+
+# --- BATCH ---
+
+def test_18_batch_dashboard_in_one_round_trip():
+    headers = _register_and_login("batch-supplier@corp.com", "supplier_admin", "Batch Co")
+    client.post("/products", json={"name": "Bolt", "price": 1.25, "quantity": 10, "unit": "pc"}, headers=headers)
+
+    response = client.post("/batch", json={"operations": [
+        {"path": "/orders"},
+        {"path": "/supplier/links"},
+        {"path": "/products/my-catalog"},
+        {"path": "/complaints"},
+        {"path": "/chat/999/older?limit=5"},
+        {"path": "/does-not-exist"},
+        {"method": "PUT", "path": "/products/999999/discount", "body": {"percent": 10}},
+    ]}, headers=headers)
+    assert response.status_code == 200
+    results = response.json()
+    assert [r["status"] for r in results] == [200, 200, 200, 200, 200, 404, 404]
+    assert [p["name"] for p in results[2]["body"]] == ["Bolt"]
+    assert results[4]["body"] == []
+
+def test_19_batch_requires_auth_and_validates_bodies():
+    assert client.post("/batch", json={"operations": [{"path": "/orders"}]}).status_code == 401
+
+    headers = _register_and_login("batch-buyer@local.com", "consumer")
+    results = client.post("/batch", json={"operations": [
+        {"method": "POST", "path": "/complaints", "body": {"details": "Late delivery"}},
+        {"method": "POST", "path": "/complaints", "body": {}},
+        {"path": "/complaints"},
+    ]}, headers=headers).json()
+    assert [r["status"] for r in results] == [200, 422, 200]
+    # Operations run in request order, so a read after a write sees it
+    assert [c["details"] for c in results[2]["body"]] == ["Late delivery"]
+    assert [c["details"] for c in client.get("/complaints", headers=headers).json()] == ["Late delivery"]
+
+def test_19b_batch_reports_unexpected_errors_per_operation(monkeypatch):
+    import app_runner
+    def broken(db, vendor_vid):
+        raise RuntimeError("boom")
+    monkeypatch.setattr(app_runner, "catalog_for", broken)
+
+    headers = _register_and_login("batch-broken@corp.com", "supplier_admin")
+    results = client.post("/batch", json={"operations": [
+        {"path": "/products/my-catalog"},
+        {"path": "/orders"},
+        {"method": "POST", "path": "/products", "body": {"name": "Nut", "price": 0.5, "quantity": 5, "unit": "pc"}},
+    ]}, headers=headers).json()
+    assert [r["status"] for r in results] == [500, 200, 200]
+
+def test_19c_batch_reads_before_a_write_share_the_snapshot():
+    headers = _register_and_login("batch-chat@local.com", "consumer")
+    peer = _user_id("batch-buyer@local.com")
+    results = client.post("/batch", json={"operations": [
+        {"path": f"/chat/{peer}"},
+        {"method": "POST", "path": "/chat", "body": {"recipient_id": peer, "content": "hi"}},
+        {"path": f"/chat/{peer}"},
+    ]}, headers=headers).json()
+    assert [r["status"] for r in results] == [200, 200, 200]
+    assert results[0]["body"] == []
+    assert [m["content"] for m in results[2]["body"]] == ["hi"]
+
+
+# --- READ-ONLY SESSIONS ---
+
+from sqlalchemy.exc import OperationalError
+from data_storage import get_read_connection, SupportCase, CatalogItem
+
+def test_20_read_session_is_read_only_snapshot():
+    reader = get_read_connection()
+    db = next(reader)
+    before = db.execute(select(func.count(SupportCase.sc_id))).scalar()
+
+    writer = SessionLocal()
+    writer.add(SupportCase(consumer_uid=1, narrative="written during a read"))
+    writer.commit()
+    writer.close()
+
+    # Same request, same snapshot: the concurrent write is not visible yet
+    assert db.execute(select(func.count(SupportCase.sc_id))).scalar() == before
+    with pytest.raises(OperationalError):
+        db.execute(SupportCase.__table__.delete())
+    reader.close()
+
+    fresh = get_read_connection()
+    assert next(fresh).execute(select(func.count(SupportCase.sc_id))).scalar() == before + 1
+    fresh.close()
+
+def test_20b_stale_snapshot_does_not_refill_cache():
+    import app_runner
+    from cache_bus import bus
+    headers = _register_and_login("snapshot-supplier@corp.com", "supplier_admin")
+    vid = client.post("/products", json={"name": "Old", "price": 1.0, "quantity": 1, "unit": "pc"}, headers=headers).json()["supplier_id"]
+
+    reader = get_read_connection()
+    db = next(reader)
+    db.execute(select(func.count(SupportCase.sc_id))).scalar()  # snapshot starts here
+
+    writer = SessionLocal()
+    writer.execute(CatalogItem.__table__.update().where(CatalogItem.vendor_id == vid).values(title="New"))
+    bus.publish(writer, "catalogs", vid)
+    writer.commit()
+    writer.close()
+
+    # The handler still sees the old snapshot but must not publish it to the cache
+    assert [p["name"] for p in app_runner.catalog_for(db, vid)] == ["Old"]
+    assert catalog_cache.get(str(vid)) is None
+    reader.close()
+    assert [p["name"] for p in client.get("/products/my-catalog", headers=headers).json()] == ["New"]
+
+
+# --- DISCOVERY FEED ---
+
+from sqlalchemy import event
+from data_storage import VendorEntity, VendorRanking
+import discovery
+from discovery import refresh_all_rankings, backfill_rankings
+
+def test_21_supplier_feed_is_ranked_and_paged():
+    small = _register_and_login("feed-small@corp.com", "supplier_admin", "Small Feed Co")
+    big = _register_and_login("feed-big@corp.com", "supplier_admin", "Big Feed Co")
+    hidden = _register_and_login("feed-hidden@corp.com", "supplier_admin", "Hidden Feed Co")
+    for headers in (small, big, hidden):
+        client.post("/products", json={"name": "Item", "price": 1.0, "quantity": 1, "unit": "pc"}, headers=headers)
+    for n in range(3):
+        client.post("/products", json={"name": f"Extra {n}", "price": 1.0, "quantity": 1, "unit": "pc"}, headers=big)
+    client.post("/supplier/visibility/show", headers=small)
+    client.post("/supplier/visibility/show", headers=big)
+
+    # Ranking rows are kept current by the write endpoints, no rebuild needed
+    db = SessionLocal()
+    ranks = {v.display_name: r for r, v in db.execute(
+        select(VendorRanking, VendorEntity).join(VendorEntity, VendorRanking.vendor_vid == VendorEntity.vid)
+    ).all()}
+    assert ranks["Big Feed Co"].catalog_size == 4
+    assert ranks["Big Feed Co"].score > ranks["Small Feed Co"].score
+    assert not ranks["Hidden Feed Co"].listed
+    db.close()
+
+    names = []
+    cursor = None
+    while True:
+        params = {"limit": 1}
+        if cursor: params["cursor"] = cursor
+        page = client.get("/suppliers/feed", params=params).json()
+        names += [item["name"] for item in page["items"]]
+        cursor = page["next_cursor"]
+        if not cursor: break
+    assert names.index("Big Feed Co") < names.index("Small Feed Co")
+    assert "Hidden Feed Co" not in names
+    assert client.get("/suppliers/feed", params={"cursor": "garbage"}).status_code == 400
+
+def test_22_full_refresh_picks_up_verification(monkeypatch):
+    monkeypatch.setattr(discovery, "REFRESH_BATCH_SIZE", 2)
+    db = SessionLocal()
+    small = db.execute(select(VendorEntity).where(VendorEntity.display_name == "Small Feed Co")).scalars().first()
+    small.is_verified = True
+    db.commit()
+    commits = []
+    event.listen(db, "after_commit", lambda session: commits.append(session))
+    refreshed = refresh_all_rankings(db)
+    db.close()
+    # The rebuild commits in chunks instead of holding the write lock throughout
+    assert len(commits) == -(-refreshed // 2)
+
+    names = [item["name"] for item in client.get("/suppliers/feed").json()["items"]]
+    assert names.index("Small Feed Co") < names.index("Big Feed Co")
+
+def test_22b_backfill_creates_missing_rankings():
+    db = SessionLocal()
+    vendor = VendorEntity(identity_id=1, display_name="Legacy Co", is_discoverable=True)
+    db.add(vendor)
+    db.commit()
+    assert backfill_rankings(db) == 1
+    assert backfill_rankings(db) == 0
+    db.close()
+    assert "Legacy Co" in [item["name"] for item in client.get("/suppliers/feed", params={"limit": 100}).json()["items"]]
+
+
+# --- DEBUG PROFILING ---
+
+import profiling
+from app_runner import create_app
+
+def test_23_profile_header_returns_sql_and_handler_report(monkeypatch):
+    monkeypatch.setattr(profiling, "PROFILE_MODE", "header")
+    monkeypatch.setattr(profiling, "PROFILE_SECRET", "s3cret")
+    debug_client = TestClient(create_app())
+    headers = _register_and_login("profiled-supplier@corp.com", "supplier_admin", "Profiled Co")
+
+    plain = debug_client.get("/supplier/links", headers=headers)
+    assert plain.status_code == 200 and plain.json() == []
+
+    profiled = debug_client.get("/supplier/links", headers={**headers, "X-Debug-Profile": "s3cret", "Origin": "http://frontend.local"})
+    assert profiled.status_code == 200
+    assert profiled.headers["access-control-allow-origin"]
+    data = profiled.json()
+    assert data["response"] == []
+    report = data["profile"]
+    assert report["path"] == "/supplier/links"
+    assert report["sql"]["count"] == len(report["sql"]["statements"]) >= 1
+    statement = next(s for s in report["sql"]["statements"] if "biz_connections" in s["sql"])
+    assert statement["duration_ms"] >= 0
+    assert any("biz_connections" in line or "SCAN" in line or "SEARCH" in line for line in statement["plan"])
+    assert all(s["plan"] is None for s in report["sql"]["statements"] if s["sql"].startswith("BEGIN"))
+    assert report["python"]["handler_ms"] is not None
+    assert any("get_incoming_links" in f["function"] for f in report["python"]["top"])
+
+def test_23b_profile_header_needs_the_secret(monkeypatch):
+    monkeypatch.setattr(profiling, "PROFILE_MODE", "header")
+    debug_client = TestClient(create_app())
+    headers = _register_and_login("unprofiled-supplier@corp.com", "supplier_admin", "Unprofiled Co")
+
+    monkeypatch.setattr(profiling, "PROFILE_SECRET", "")
+    assert debug_client.get("/supplier/links", headers={**headers, "X-Debug-Profile": "1"}).json() == []
+    monkeypatch.setattr(profiling, "PROFILE_SECRET", "s3cret")
+    assert debug_client.get("/supplier/links", headers={**headers, "X-Debug-Profile": "wrong"}).json() == []
+
+def test_24_profiling_off_by_default():
+    response = client.get("/suppliers", headers={"X-Debug-Profile": "1"})
+    assert isinstance(response.json(), list)